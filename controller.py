@@ -9,13 +9,14 @@ class   Controller:
 
     """
 
-    def __init__(self,address,port):
+    def __init__(self,address,port,rcvbuf=None):
         """
         constructs a TCP socket using IPv4 protocols with the controller, starts the logger
 
             args:
                 address - (string) : string containing the IPv4 address of the controller, eg. '192.168.1.28'
                 port - (int) : port number the controller is on, eg. 10000
+                rcvbuf - (None or int) : optional size of the socket receive buffer in bytes, set before connecting so the TCP window can use it
             returns:
                 nothing
         """
@@ -28,6 +29,17 @@ class   Controller:
         self.sckt    = socket.socket()
         self.sckt.settimeout(10)         #set the socket timeout
 
+        if rcvbuf:
+            self.sckt.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+
+        #size actually granted by the operating system (Linux doubles the request)
+        self.rcvbuf  = self.sckt.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+        #reusable receive buffer and counters of the receive syscalls
+        self.buff    = bytearray()
+        self.n_recv  = 0
+        self.n_bytes = 0
+
         try:
             #connect the socket to the appropriate address/port
             self.sckt.connect((self.address,self.port))
@@ -81,9 +93,27 @@ class   Controller:
         self.sckt.send(bf)
         self.logger.info('Requested circular buffer from Q.Gate')
 
+    def set_lowat(self,n_bytes):
+        """
+        sets the socket receive low watermark, so a blocking read only wakes up once that many bytes are available
+        the watermark is capped to half the receive buffer, does nothing on systems without SO_RCVLOWAT
+
+            args:
+                n_bytes - (int) : low watermark in bytes
+            returns:
+                nothing
+        """
+        if not hasattr(socket, 'SO_RCVLOWAT'):
+            return
+
+        lowat = max(1, min(n_bytes, self.rcvbuf//2))
+        self.sckt.setsockopt(socket.SOL_SOCKET, socket.SO_RCVLOWAT, lowat)
+        self.logger.debug('Set receive low watermark to: '+ str(lowat))
+
     def acquire_buffer(self,frame_size,n_frames):
         """
         receives the circular buffer data from the controller over the socket
+        as many reads as needed are made to return exactly n_frames whole frames, so a frame is never split between calls
 
             args:
                 frame_size - (int) : number of bytes in a single frame (including timestamp)
@@ -92,11 +122,26 @@ class   Controller:
             returns:
                 buff - (bytes) : bytestring of length frame_size*n_frames, corresponding to the frames
         """
+        want = frame_size*n_frames
+        if len(self.buff) < want:
+            self.buff = bytearray(want)
+        view = memoryview(self.buff)
+
         #receives n_frames of the given frame_size
-        buff = self.sckt.recv(frame_size*n_frames)
-        self.logger.info('Received circular buffer from Q.Gate')
+        got = 0
+        while got < want:
+            n = self.sckt.recv_into(view[got:want], want - got)
+            self.n_recv += 1
+
+            #an empty read means the controller closed the connection
+            if not n:
+                self.logger.error('Connection closed by Q.Gate')
+                raise ConnectionError('connection closed by the controller')
+            got += n
+
+        self.n_bytes += got
 
-        return buff
+        return bytes(view[:want])
 
     def close(self):
         """
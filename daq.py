@@ -1,51 +1,101 @@
 #standard python repository
 import time
-import csv
+import socket
 import logging
 
 #SciPy stack
-from scipy.signal import welch
+import numpy as np
 
 #my classes
 from controller import Controller
 from udbf import UDBF
+from spectrum import Spectrum
+from recording import stamp
+from writer import Writer
 
-def dict_writer(filename, headers, data):
+def daq_args(config):
     """
-    writes a dictionary of values to a csvfile
+    reads the DAQ keyword arguments from the [convert], [psd], [cross], [writer] and [network] sections of a configuration file,
+    options not in the file are left out so they keep the DAQ, Spectrum and Writer defaults
+    the address and port of the controller are not included
 
         args:
-            filename - (string) : name of the file to write the data to
-            headers - (list) : array of strings of the key names to write to file, in the order of columns
-            data - (dict) : dictionary where keys are strings, and values are array of values to be written to file
+            config - (ConfigParser) : parsed configuration file, with the case of the options preserved
         returns:
-            nothing
-
+            kwargs - (dict) : keyword arguments for the DAQ class
     """
-    with open(filename, 'w') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=headers)
-        writer.writeheader()
-
-        #while there is data in the first column
-        while any(data[headers[0]]):
-            try:
-                #make a dictionary containing the row
-                d = {header:data[header].pop(0) for header in headers}
-                writer.writerow(d)
-
-            except IndexError:
-                #unless the array is empty, break the while loop
-                break
-            except:
-                #any other errors raise normally
-                raise
+    kwargs = {}
+
+    #conversion parameters
+    if 'convert' in config.sections():
+        kwargs['convert'] = {key:config['convert'].getfloat(key) for key in config['convert']}
+
+    #psd parameters
+    psd_opts = {}
+    if 'psd' in config.sections():
+        cfg = config['psd']
+        if 'NFFT' in cfg:
+            kwargs['n_fft'] = cfg.getint('NFFT')
+        if 'Averages' in cfg:
+            kwargs['n_avg'] = cfg.getint('Averages')
+        if 'Window' in cfg:
+            #windows with parameters are given as comma separated values, eg. tukey, 0.25
+            win = [w.strip() for w in cfg.get('Window').split(',')]
+            psd_opts['window'] = win[0] if len(win) == 1 else (win[0],) + tuple(float(w) for w in win[1:])
+        if 'Segment' in cfg:
+            psd_opts['nperseg'] = cfg.getint('Segment')
+        if 'Overlap' in cfg:
+            psd_opts['overlap'] = cfg.getfloat('Overlap')
+        if 'Detrend' in cfg:
+            psd_opts['detrend'] = False if cfg.get('Detrend').lower() in ('none','false','no') else cfg.get('Detrend').lower()
+        if 'Scaling' in cfg:
+            psd_opts['scaling'] = cfg.get('Scaling').lower()
+        if 'Float32' in cfg:
+            psd_opts['float32'] = cfg.getboolean('Float32')
+        if 'Workers' in cfg:
+            psd_opts['workers'] = cfg.getint('Workers')
+        if 'WorkersMinFFT' in cfg:
+            psd_opts['workers_min'] = cfg.getint('WorkersMinFFT')
+    kwargs['psd_opts'] = psd_opts
+
+    #cross spectral analysis, coherence and transfer functions from every input to every output
+    if 'cross' in config.sections() and config['cross'].getboolean('Enable', False):
+        inputs  = [name.strip() for name in config['cross'].get('Inputs').split(',')]
+        outputs = [name.strip() for name in config['cross'].get('Outputs').split(',')]
+        kwargs['cross_pairs'] = [(i, o) for i in inputs for o in outputs]
+
+    #writer parameters
+    writer_opts = {}
+    if 'writer' in config.sections():
+        cfg = config['writer']
+        if 'MaxBytes' in cfg:
+            writer_opts['max_bytes'] = cfg.getint('MaxBytes')
+        if 'MaxAge' in cfg:
+            writer_opts['max_age'] = cfg.getfloat('MaxAge')
+        if 'Fsync' in cfg:
+            writer_opts['fsync'] = cfg.get('Fsync').lower()
+        if 'Batch' in cfg:
+            writer_opts['batch'] = cfg.getint('Batch')
+        if 'MaxQueue' in cfg:
+            writer_opts['max_queue'] = cfg.getint('MaxQueue')
+    kwargs['writer_opts'] = writer_opts
+
+    #network parameters
+    if 'network' in config.sections():
+        cfg = config['network']
+        if 'Latency' in cfg:
+            kwargs['latency'] = cfg.getfloat('Latency')
+        if 'RcvBuf' in cfg:
+            kwargs['rcvbuf'] = cfg.getint('RcvBuf')
+
+    return kwargs
 
 class   DAQ:
     """
     The DAQ class sets up the Controller and UDBF classes and allows for the sensors values to be read out
     """
 
-    def __init__(self, address, port, queue, scope_on=False, n_frames=100, n_fft=1e3, n_avg=10, save_raw=False, save_psd=True, convert=None):
+    def __init__(self, address, port, queue, scope_on=False, n_frames=None, n_fft=1e3, n_avg=10, save_raw=False, save_psd=True, convert=None, time_scale=1, psd_opts=None, latency=0.1, rcvbuf=2**22, n_scope=100, vib_path=None, psd_path=None, writer_opts=None, cross_pairs=None):
         """
         constructs the DAQ class, starts the logger
 
@@ -53,18 +103,27 @@ class   DAQ:
                 address - (string) : string containing the IPv4 address of the controller, eg. '192.168.1.28'
                 port - (int) : port number the controller is on, eg. 10000
                 queue - (Queue) : queue object to write the data to in a thread safe way
-                n_frames - (int) : number of frames to acquire each time the circular buffer is read out
+                n_frames - (None or int) : number of frames to acquire each time the circular buffer is read out, None sizes the reads from the observed data rate and the latency target
                 n_fft - (int) : number of frames in each PSD and CSV file
                 scope_on - (bool) : boolean flag to specify if the scope is being used, if so puts the decoded frames in the queue
                 save_raw - (bool) : boolean flag to specify if the raw traces (converted if conversions provided) are saved to a CSV file
                 save_psd - (bool) : boolean flag to specify if the psd (converted if conversions provided) are saved to a CSV file
                 convert - (None or dict) : optional parameter to pass that gives a conversion for variables if the key matches the controller
+                time_scale - (number) : factor by which the controller runs faster than real time, only differs from 1 with a simulated controller
+                psd_opts - (None or dict) : optional keyword arguments for the Spectrum class, eg. window, overlap, detrend, scaling and float32
+                latency - (number) : target time in seconds covered by a single read when n_frames is None
+                rcvbuf - (None or int) : size of the socket receive buffer in bytes
+                n_scope - (int) : number of frames in each trace put in the queue for the scope
+                vib_path - (None or string) : directory the raw traces are written to, None writes to the current directory without recovering it
+                psd_path - (None or string) : directory the PSDs are written to, None writes to the current directory without recovering it
+                writer_opts - (None or dict) : optional keyword arguments for the Writer class, eg. max_bytes, max_age and fsync
+                cross_pairs - (None or list) : optional list of (input, output) channel name pairs, eg. [('TAXX','SAX1')], whose coherence and transfer function are saved with the PSD
             returns:
                 nothing
         """
 
         self.logger = logging.getLogger('vib_daq.daq.DAQ')
-        self.ctrl = Controller(address,port)
+        self.ctrl = Controller(address,port,rcvbuf)
         self.udbf = UDBF()
 
         #queue for storing the data
@@ -76,14 +135,34 @@ class   DAQ:
         self.scope_on = scope_on
         self.save_raw = save_raw
         self.save_psd = save_psd
+        self.save_cross = bool(cross_pairs)
 
         #optional conversion argument, either None or a dict
         self.convert  = convert
 
+        #output directories and the background writer for the files
+        self.vib_path = vib_path or '.'
+        self.psd_path = psd_path or '.'
+
+        #leftover temporary files are only recovered in directories given explicitly
+        self.recover_paths = [path for path in (vib_path, psd_path) if path]
+        self.writer   = Writer(**(writer_opts or {}))
+
         #parameters regarding the number of frames acquired and psd/file size
         self.n_frames = n_frames
-        self.n_fft    = n_fft
+        self.n_fft    = int(n_fft)
         self.n_avg    = n_avg
+        self.n_scope  = n_scope
+
+        #reads are sized adaptively when n_frames is not given
+        self.adaptive = n_frames is None
+        self.latency  = latency
+
+        #factor by which the controller runs faster than real time, only used for the initial data rate estimate
+        self.time_scale = time_scale
+
+        #receive statistics of the last block, frames per syscall and end-to-end latency
+        self.stats = {}
 
         self.logger.info('Created DAQ successfully')
 
@@ -97,6 +176,34 @@ class   DAQ:
         #get sampling frequency
         self.fs = self.udbf.SampleRate
 
+        #set up the PSD estimator, its windows are cached and reused for every block
+        self.spectrum = Spectrum(self.fs, self.n_fft, **(psd_opts or {}))
+
+        #channel pairs for the cross spectral analysis, as indices into the rows of the spectra
+        self.cross_pairs = list(cross_pairs or [])
+        keys = self.udbf.var_names[1:]
+        for pair in self.cross_pairs:
+            if not all(name in keys for name in pair):
+                self.logger.error('Unknown channel in cross spectral pair: '+ '-'.join(pair))
+                raise ValueError('cross spectral pairs must be channels of the controller')
+        self.cross_idx = [(keys.index(a), keys.index(b)) for a,b in self.cross_pairs]
+
+        #expected data rate in frames per second, refined from the observed rate
+        self.rate = self.fs*self.time_scale
+        if self.adaptive:
+            self.n_frames = self.read_size()
+
+    def read_size(self):
+        """
+        number of frames to read at once so that a read covers the latency target at the current data rate
+
+            args:
+                nothing
+            returns:
+                n - (int) : number of frames, between 1 and n_fft
+        """
+        return int(min(max(self.rate*self.latency, 1), self.n_fft))
+
 
     def run(self):
         """
@@ -108,47 +215,60 @@ class   DAQ:
             returns:
                 nothing
         """
-        #start the circular buffer
-        self.ctrl.request_buffer()
-
         self.frame_size = sum(self.udbf.var_sizes)
 
+        #frames waiting to fill the next scope trace
+        scope = {key:[] for key in ('TAXX','TAXY','TAXZ')}
+
         try:
+            #start the writer and the circular buffer, inside the try so the writer is always closed
+            self.writer.start(self.recover_paths)
+            self.ctrl.request_buffer()
+            self.ctrl.set_lowat(self.frame_size*self.n_frames)
+
             #loop until user specifies to end
             while self.take_data:
                 if not self.paused:
 
-                    #generate a filename from the current time
-                    stamp = time.strftime('%y%m%d_%H%M%S', time.localtime())
-                    psdfile = 'psd_fs'+ str(int(self.fs)) + '_' + stamp + '.csv'
+                    #initialize the array that will hold the averaged PSDs, one row per channel
+                    keys = self.udbf.var_names[1:]
+                    psd  = np.zeros((len(keys), self.n_fft//2 + 1), dtype=self.spectrum.dtype)
 
-                    #initialize dictionary that will hold averaged PSDs
-                    psd  = {name:[0 for _ in range(self.n_fft)] for name in self.udbf.var_names[1:]}
+                    #with the cross spectral analysis on, the full cross spectral matrix is averaged instead
+                    cross = self.save_cross and bool(self.cross_idx)
+                    if cross:
+                        csd = np.zeros((len(keys), len(keys), self.n_fft//2 + 1), dtype=np.result_type(self.spectrum.dtype, np.complex64))
 
                     #loop for the number of averages that are used
                     for avg_ in range(self.n_avg):
 
-                        #make dictionaries for data
+                        #make dictionaries for data, and a list for the absolute time of each chunk
                         data = {name:[] for name in self.udbf.var_names}
+                        times = []
 
-                        #pause to let the buffer fill up
-                        time.sleep(self.n_fft/self.fs)
-
-                        self.logger.info('Acquiring '+ str(int(self.n_fft))+ ' frames of data')
+                        self.logger.info('Acquiring '+ str(int(self.n_fft))+ ' frames of data in reads of '+ str(self.n_frames))
 
                         frame_count = 0
+                        n_recv = self.ctrl.n_recv
+                        latency = []
 
-
+                        #reads block until the frames arrive, the low watermark keeps them from waking up early
                         while frame_count < self.n_fft:
 
-                            frame_count += self.n_frames
+                            n = min(self.n_frames, self.n_fft - frame_count)
+                            frame_count += n
 
                             #acquire the buffer
-                            buff = self.ctrl.acquire_buffer(self.frame_size, self.n_frames)
+                            buff = self.ctrl.acquire_buffer(self.frame_size, n)
 
                             #decode the buffer
                             frames = self.udbf.decode_buffer(buff)
-                            self.logger.info('Succesfully decoded binary buffer')
+
+                            #absolute time of the frames, from the raw counter before any conversion
+                            times.append(self.udbf.timestamps(frames['Counter']))
+                            #latency from when the last frame was sampled, in wall time when the controller is accelerated
+                            t_last = self.udbf.t0 + (times[-1][-1] - self.udbf.t0)/self.time_scale
+                            latency.append(time.time() - t_last)
 
                             #add the frames to the data dict
                             for key in data:
@@ -156,51 +276,92 @@ class   DAQ:
                                 #do the conversion if convert dict provided
                                 if self.convert and self.convert[key]:
                                     frames[key] = [self.convert[key]*val for val in frames[key]]
-                                    self.logger.debug('Converted values: '+key)
                                 data[key] += frames[key]
 
-                            #if the scope is on put the frames in the queue
+                            #if the scope is on put the frames in the queue, in traces of n_scope frames
+                            #frames left over from a read are carried over to the next one so the traces stay contiguous
                             if self.scope_on:
-                                tp = (frames['TAXX'],frames['TAXY'],frames['TAXZ'])
-                                if all(len(ls)==self.n_frames for ls in tp):
-                                    self.queue.put(tp)
-
-                            #save the raw trace
-                            if self.save_raw:
-                                #generate filename for raw file
-                                stamp = time.strftime('%y%m%d_%H%M%S', time.localtime())
-                                vibfile = 'vib_fs'+ str(int(self.fs)) + '_' + stamp + '.csv'
-
-                                #write the file
-                                dict_writer(vibfile, self.udbf.var_names[1:], data)
-                                self.logger.info('Wrote raw trace to csv file: '+ vibfile)
-
-                            #calculate psd here
-                            for key in psd:
-                                freq, Pxx = welch(data[key], fs=self.fs, nfft=self.n_fft)
-
-                                #loop over each value in the PSD and add it to the avg psd set
-                                for idx, val in enumerate(list(Pxx)):
-                                    psd[key][idx] += val
+                                for key in scope:
+                                    scope[key] += frames[key]
+                                while len(scope['TAXX']) >= self.n_scope:
+                                    self.queue.put(tuple(scope[key][:self.n_scope] for key in ('TAXX','TAXY','TAXZ')))
+                                    for key in scope:
+                                        del scope[key][:self.n_scope]
+                            else:
+                                scope = {key:[] for key in ('TAXX','TAXY','TAXZ')}
+
+                        #absolute time of every frame of the block
+                        t = np.concatenate(times)
+
+                        #report the receive statistics of the block
+                        self.stats = {
+                            'frames_per_syscall' : self.n_fft/max(self.ctrl.n_recv - n_recv, 1),
+                            'latency'            : sum(latency)/len(latency),
+                            'read_frames'        : self.n_frames,
+                            'writer_queue'       : self.writer.depth(),
+                            }
+                        self.logger.info('Received block: '+ '{:.1f}'.format(self.stats['frames_per_syscall']) + ' frames per syscall, ' + '{:.3f}'.format(self.stats['latency']) + ' s mean latency, ' + str(self.stats['writer_queue']) + ' jobs queued for writing')
+
+                        #resize the reads from the observed data rate, taken from the span of the Counter timestamps
+                        #rather than the time spent reading, which drops after a processing stall while the backlog drains
+                        span = (t[-1] - t[0])/self.time_scale
+                        if self.adaptive and span > 0:
+                            self.rate = 0.5*self.rate + 0.5*(len(t) - 1)/span
+                            if self.read_size() != self.n_frames:
+                                self.n_frames = self.read_size()
+                                self.ctrl.set_lowat(self.frame_size*self.n_frames)
+
+                        #calculate the psd of all channels in one batch, from the whole block
+                        #the cross spectral matrix comes from the same FFT segments, its diagonal is the psd
+                        if cross:
+                            freq, Sxy = self.spectrum.csd([data[key] for key in keys])
+                            csd += Sxy
+                        else:
+                            freq, Pxx = self.spectrum.psd([data[key] for key in keys])
+                            psd += Pxx
+
+                        #files are named by the absolute time of their first frame
+                        if avg_ == 0:
+                            psdfile = 'psd_fs'+ str(int(self.fs)) + '_' + stamp(t[0]) + '.csv'
+
+                        #save the raw trace, with the absolute time as the first column so it can be searched
+                        if self.save_raw:
+                            self.writer.append(self.vib_path, 'vib_fs'+ str(int(self.fs)), ['Time'] + keys, [t.tolist()] + [data[key] for key in keys])
 
                     #divide the PSD values by the number of averages used
-                    for key in psd:
-                        for idx,val in enumerate(psd[key]):
-                            psd[key][idx] = val/self.n_avg
+                    if cross:
+                        csd /= self.n_avg
+                        psd = csd.diagonal(axis1=0, axis2=1).real.T
+                    else:
+                        psd /= self.n_avg
 
                     #save the PSD
                     if self.save_psd:
-                        dict_writer(psdfile, self.udbf.var_names[1:], psd)
-                        self.logger.info('Wrote PSD to csv file: '+ psdfile)
+                        self.writer.write(self.psd_path, psdfile, keys, psd.tolist())
+
+                    #save the coherence and H1 transfer function of each pair, named like the PSD
+                    if cross:
+                        coh = self.spectrum.coherence(csd)
+                        tf  = self.spectrum.transfer(csd)
+                        names = [keys[i] + '-' + keys[j] for i,j in self.cross_idx]
+
+                        self.writer.write(self.psd_path, psdfile.replace('psd_', 'coh_', 1), names, [coh[i,j].tolist() for i,j in self.cross_idx])
+                        self.writer.write(self.psd_path, psdfile.replace('psd_', 'tf_', 1),
+                                [name + part for name in names for part in (' re', ' im')],
+                                [part for i,j in self.cross_idx for part in (tf[i,j].real.tolist(), tf[i,j].imag.tolist())])
 
         except socket.timeout:
             self.logger.error('socket timed out')
             pass
+        except ConnectionError:
+            self.logger.error('connection to the controller was lost')
+            pass
         except:
             self.logger.error('Unexpected error occurred')
             raise
 
         finally:
             self.ctrl.close()
+            self.writer.close()
             self.logger.info('Data acquisition finished')
 
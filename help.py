@@ -8,6 +8,11 @@ from daq import DAQ
 from controller import Controller
 from udbf import UDBF
 from scope import Scope
+from spectrum import Spectrum
+from recording import Recordings
+from writer import Writer
+from simulator import Simulator
+from soak import Soak
 import main
 
 
@@ -10,7 +10,7 @@ import threading
 import queue
 
 #my classes
-from daq import DAQ
+from daq import DAQ, daq_args
 from scope import Scope
 
 def input_usage():
@@ -20,6 +20,7 @@ def input_usage():
     print('s : toggle scope')
     print('r : toggle save raw')
     print('f : toggle save psd')
+    print('c : toggle save coherence and transfer functions')
 
 def user_input(daq):
     print('Enter "h" for options')
@@ -41,6 +42,9 @@ def user_input(daq):
         elif msg == 'f':
             daq.save_psd = not daq.save_psd
 
+        elif msg == 'c':
+            daq.save_cross = not daq.save_cross
+
         elif msg == 's':
             daq.scope_on = not daq.scope_on
 
@@ -72,7 +76,6 @@ def main():
 #----------------    Path Related Things    ----------------#
 
     #make the relavent full paths
-    cwd = os.getcwd()
     daq_path = sys.path[0]
     data_path = os.path.join(daq_path, 'data')
     vib_path = os.path.join(data_path, 'vib')
@@ -158,10 +161,8 @@ def main():
     cfg_file = os.path.join(daq_path,'vib_daq.cfg')
     config.read(cfg_file)
 
-    #conversion parameters
-    convert = None
-    if 'convert' in config.sections():
-        convert = {key:config['convert'].getfloat(key) for key in config['convert']}
+    #DAQ parameters shared with the soak test, options not in the config file keep the class defaults
+    daq_opts = daq_args(config)
 
     #network parameters
     if not address:
@@ -175,7 +176,7 @@ def main():
     q = queue.Queue()
 
     #create DAQ instance
-    daq = DAQ(address, port, q, scope_on=scope_on, convert=convert)
+    daq = DAQ(address, port, q, scope_on=scope_on, vib_path=vib_path, psd_path=psd_path, **daq_opts)
 
     #create daq thread so console input can be received without blocking
     daq_thread = threading.Thread(target=daq.run)
@@ -193,7 +194,7 @@ def main():
 
             if scope is None:
                 #create the scope
-                scope = Scope(daq.fs, daq.n_frames)
+                scope = Scope(daq.fs, daq.n_scope)
 
             if not q.empty():
                 traces = q.get()
@@ -209,19 +210,5 @@ def main():
     inpt_thread.join()
     daq_thread.join()
 
-#-----------------    Clean Up Files    -----------------#
-
-    #loop through the files in the daq directory, moving csv files with the correct formatting to the data directory
-    files = os.listdir(cwd)
-    for f in files:
-        if f.startswith('vib_') and f.endswith('.csv'):
-            src = os.path.join(cwd,f)
-            dst = os.path.join(vib_path,f)
-            os.rename(src,dst)
-        elif f.startswith('psd_') and f.endswith('.csv'):
-            src = os.path.join(cwd,f)
-            dst = os.path.join(psd_path,f)
-            os.rename(src,dst)
-
 if __name__ == '__main__':
     main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#standard python repository
+import sys, getopt
+import os
+import re
+import bisect
+import logging
+import datetime
+
+#SciPy stack
+import numpy as np
+
+#format of the timestamp in the file names, always in UTC so that names sort in time order
+STAMP_FMT = '%y%m%d_%H%M%S_%f'
+
+#matches recordings written by the DAQ, eg. vib_fs1000_181019_140310_123456.csv
+#including the raw trace stream still being written, which ends in .csv.part until it is rotated
+NAME_RE = re.compile(r'^(vib|psd)_fs(\d+)_(\d{6}_\d{6}_\d{6})\.csv(\.part)?$')
+
+def stamp(t):
+    """
+    formats an absolute time as the timestamp used in recording file names, with microsecond resolution
+
+        args:
+            t - (float) : unix timestamp in seconds
+        returns:
+            s - (string) : timestamp in UTC, eg. '181019_140310_123456'
+    """
+    return datetime.datetime.fromtimestamp(t, datetime.timezone.utc).strftime(STAMP_FMT)
+
+def parse_stamp(s):
+    """
+    inverse of stamp, converts a file name timestamp back to absolute time
+
+        args:
+            s - (string) : timestamp in UTC, eg. '181019_140310_123456'
+        returns:
+            t - (float) : unix timestamp in seconds
+    """
+    return datetime.datetime.strptime(s, STAMP_FMT).replace(tzinfo=datetime.timezone.utc).timestamp()
+
+def last_newline(fh, chunk=2**16):
+    """
+    finds the end of the last complete line of a file, reading backwards from the end a chunk at a time
+
+        args:
+            fh - (file) : file opened in binary mode
+            chunk - (int) : number of bytes read at a time
+        returns:
+            end - (int) : byte offset just after the last newline, 0 if the file has none
+    """
+    pos = fh.seek(0, os.SEEK_END)
+    while pos > 0:
+        n = min(chunk, pos)
+        pos -= n
+        fh.seek(pos)
+        i = fh.read(n).rfind(b'\n')
+        if i >= 0:
+            return pos + i + 1
+    return 0
+
+def parse_time(s):
+    """
+    parses a time given on the command line, either a unix timestamp, an ISO date and time, or a time of day (today, local time)
+
+        args:
+            s - (string) : eg. '1539957790.5', '2018-10-19 14:03:10' or '14:03:10.5'
+        returns:
+            t - (float) : unix timestamp in seconds
+    """
+    try:
+        return float(s)
+    except ValueError:
+        pass
+
+    try:
+        dt = datetime.datetime.fromisoformat(s)
+    except ValueError:
+        dt = datetime.datetime.combine(datetime.date.today(), datetime.time.fromisoformat(s))
+
+    return dt.timestamp()
+
+class   Recordings:
+    """
+    The Recordings class indexes the raw trace files written by the DAQ by their timestamps,
+    and reads out time ranges of a channel by binary searching first the file names and then the bytes within each file
+    The stream file still being written (.csv.part) is included, up to its last complete row, so the latest data can be queried
+    """
+
+    def __init__(self, path, prefix='vib'):
+        """
+        constructs the Recordings class, indexes the files in the directory and starts the logger
+
+            args:
+                path - (string) : directory containing the recordings, eg. 'data/vib'
+                prefix - (string) : type of recording to index, 'vib' for raw traces
+            returns:
+                nothing
+        """
+
+        self.logger = logging.getLogger('vib_daq.recording.Recordings')
+        self.path = path
+        self.prefix = prefix
+        self.index()
+
+    def index(self):
+        """
+        (re)builds the sorted lists of file names and start times, call again to pick up new files
+
+            args:
+                nothing
+            returns:
+                nothing
+        """
+        found = []
+        for f in os.listdir(self.path):
+            m = NAME_RE.match(f)
+            if m and m.group(1) == self.prefix:
+                found.append((parse_stamp(m.group(3)), f))
+
+        found.sort()
+        self.starts = [t for t,f in found]
+        self.files  = [f for t,f in found]
+
+        self.logger.info('Indexed '+ str(len(self.files)) + ' recordings in ' + self.path)
+
+    def offset(self, fh, t, start, size):
+        """
+        binary searches an open recording for the first row at or after a given time
+        rows are variable length, so each probe skips to the start of the next line and reads its time column
+
+            args:
+                fh - (file) : recording opened in binary mode
+                t - (float) : unix timestamp to search for
+                start - (int) : byte offset of the first data row (after the CSV header)
+                size - (int) : size of the file in bytes
+            returns:
+                pos - (int) : byte offset of the first row with a time at or after t, or size if there is none
+        """
+
+        def line_at(m):
+            #position of the first line starting at or after byte m and that line
+            if m > start:
+                fh.seek(m - 1)
+                fh.readline()
+            else:
+                fh.seek(start)
+            pos = fh.tell()
+            return pos, fh.readline()
+
+        lo, hi = start, size
+        while lo < hi:
+            mid = (lo + hi)//2
+            _, line = line_at(mid)
+            if not line.strip() or float(line.split(b',', 1)[0]) >= t:
+                hi = mid
+            else:
+                lo = mid + 1
+
+        return line_at(lo)[0]
+
+    def read(self, f, t0, t1, channel):
+        """
+        reads the rows of one recording between two times
+
+            args:
+                f - (string) : file name of the recording
+                t0 - (float) : start of the range as a unix timestamp
+                t1 - (float) : end of the range as a unix timestamp
+                channel - (string) : name of the channel, eg. 'TAXZ'
+            returns:
+                t - (array) : absolute time of each row in the range
+                vals - (array) : values of the channel in the range
+        """
+        path = os.path.join(self.path, f)
+
+        #the stream may have been rotated since it was indexed
+        if f.endswith('.part') and not os.path.exists(path):
+            path = path[:-5]
+
+        with open(path, 'rb') as fh:
+            #only complete rows are read, the writer may be in the middle of one
+            size = last_newline(fh)
+            fh.seek(0)
+
+            #a new stream may not even hold its complete header yet
+            header = fh.readline()
+            if fh.tell() > size or not header.strip():
+                return np.empty(0), np.empty(0)
+            header = header.decode().strip().split(',')
+            if channel not in header:
+                self.logger.error('Channel '+ channel + ' not in recording: ' + f)
+                raise KeyError(channel)
+            col = header.index(channel)
+
+            fh.seek(self.offset(fh, t0, fh.tell(), size))
+
+            #read rows until the end of the range
+            rows = []
+            pos = fh.tell()
+            while pos < size:
+                line = fh.readline()
+                pos += len(line)
+                if not line.strip():
+                    continue
+                fields = line.split(b',')
+                if float(fields[0]) > t1:
+                    break
+                rows.append((float(fields[0]), float(fields[col])))
+
+        rows = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return rows[:,0], rows[:,1]
+
+    def query(self, t0, t1, channel):
+        """
+        reads a channel between two times, across as many recordings as the range covers
+
+            args:
+                t0 - (float) : start of the range as a unix timestamp
+                t1 - (float) : end of the range as a unix timestamp
+                channel - (string) : name of the channel, eg. 'TAXZ'
+            returns:
+                t - (array) : absolute time of each sample in the range
+                vals - (array) : values of the channel in the range
+        """
+
+        #the last file starting at or before t0 may contain it, later files until t1 certainly do
+        first = max(bisect.bisect_right(self.starts, t0) - 1, 0)
+        last  = bisect.bisect_right(self.starts, t1)
+
+        ts, vals = [np.empty(0)], [np.empty(0)]
+        for f in self.files[first:last]:
+            t, v = self.read(f, t0, t1, channel)
+            ts.append(t)
+            vals.append(v)
+
+        self.logger.info('Read '+ channel + ' from ' + str(last - first) + ' recordings')
+
+        return np.concatenate(ts), np.concatenate(vals)
+
+def usage():
+    print('Usage: recording.py --start=<time> --end=<time> --channel=<name>')
+    print()
+    print('Times are unix timestamps, ISO dates and times, or times of day today (local time)')
+    print('Example: recording.py --start=14:03:10 --end=14:03:12 --channel=TAXZ')
+    print()
+    print('Options:')
+    print('-h, --help         : display usage')
+    print('-s, --start=       : start of the time range')
+    print('-e, --end=         : end of the time range')
+    print('-c, --channel=     : channel to read out')
+    print('-d, --dir=         : directory of the recordings, defaults to data/vib')
+
+def main():
+    """
+    Reads a time range of a channel out of the raw recordings and prints it to stdout as CSV
+    """
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hs:e:c:d:', ['help','start=','end=','channel=','dir='])
+
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    path = os.path.join(sys.path[0], 'data', 'vib')
+    t0 = t1 = channel = None
+
+    for opt, arg in opts:
+        if opt in ('-h','--help'):
+            usage()
+            sys.exit(0)
+        elif opt in ('-s','--start'):
+            t0 = parse_time(arg)
+        elif opt in ('-e','--end'):
+            t1 = parse_time(arg)
+        elif opt in ('-c','--channel'):
+            channel = arg
+        elif opt in ('-d','--dir'):
+            path = arg
+
+    if t0 is None or t1 is None or channel is None:
+        usage()
+        sys.exit(2)
+
+    t, vals = Recordings(path).query(t0, t1, channel)
+
+    print('Time,' + channel)
+    for row in zip(t.tolist(), vals.tolist()):
+        print(repr(row[0]) + ',' + repr(row[1]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+#standard python repository
+import socket
+import struct
+import logging
+import threading
+import time
+import math
+import random
+
+class   Simulator:
+    """
+    The Simulator class emulates a Gantner Q.Gate IP controller on a local TCP socket
+    It answers the same bytecode commands the Controller class sends, provides a UDBF 1.07 binary header,
+    and streams frames of synthetic sensor data, optionally many times faster than real time
+    """
+
+    def __init__(self, address='127.0.0.1', port=0, fs=1000., names=('TAXX','TAXY','TAXZ','SAX1','SAX2','SAX3'), time_scale=1.):
+        """
+        constructs the Simulator class, binds the listening socket and starts the logger
+
+            args:
+                address - (string) : IPv4 address to listen on, eg. '127.0.0.1'
+                port - (int) : port to listen on, 0 lets the operating system pick a free port
+                fs - (number) : simulated sampling frequency of the controller in Hz
+                names - (tuple) : names of the simulated sensor variables, the Counter is always prepended
+                time_scale - (number) : factor by which the data is streamed faster than real time
+            returns:
+                nothing
+        """
+
+        self.logger = logging.getLogger('vib_daq.simulator.Simulator')
+        self.fs = fs
+        self.names = list(names)
+        self.time_scale = time_scale
+
+        #flag used to stop the server thread
+        self.running = False
+        self.thread = None
+
+        #number of frames sent since the buffer was requested, and the start time given in the header
+        self.frames_sent = 0
+        self.t_start = time.time()
+
+        #create the listening socket
+        self.sckt = socket.socket()
+        self.sckt.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sckt.bind((address, port))
+        self.sckt.listen(1)
+        self.sckt.settimeout(1)
+
+        #address/port actually bound, needed when port 0 was requested
+        self.address, self.port = self.sckt.getsockname()
+
+        self.logger.info('Simulated Q.Gate listening at: '+ self.address + ' ' + str(self.port))
+
+    def make_header(self):
+        """
+        builds a UDBF 1.07 binary header describing the simulated variables, in the layout UDBF.decode_header expects
+
+            args:
+                nothing
+            returns:
+                head - (bytes) : bytestring corresponding to the binary header
+        """
+
+        vendor = b'Gantner Instruments Test & Measurement GmbH\x00'
+
+        #start time in days since 1899-12-30 (OLE automation date) with a day factor of 1
+        self.t_start = time.time()
+        start = 25569. + self.t_start/86400.
+
+        head  = bytearray()
+        head += struct.pack('>BHH', 1, 107, len(vendor)) + vendor
+        head += struct.pack('>BHdH', 0, 0, 1., 0)
+        head += struct.pack('>ddd', 1./self.fs, start, self.fs)
+        head += struct.pack('>H', len(self.names))
+
+        #variable descriptions, lengths include the trailing \x00
+        for name in self.names:
+            nm = name.encode() + b'\x00'
+            ut = b'V\x00'
+            head += struct.pack('>H', len(nm)) + nm
+            head += struct.pack('>HHHH', 1, 8, 4, 6)
+            head += struct.pack('>H', len(ut)) + ut
+            head += struct.pack('>H', 0)
+
+        return bytes(head)
+
+    def make_block(self, n):
+        """
+        builds a block of frames of synthetic data, a few sinusoids on top of gaussian noise for each variable
+
+            args:
+                n - (int) : number of frames in the block
+            returns:
+                block - (bytearray) : frames in the binary format of the circular buffer, with the counters zeroed
+        """
+
+        fmt = '>d' + 'f'*len(self.names)
+        block = bytearray()
+
+        for i in range(n):
+            t = i/self.fs
+            vals = [0.01*math.sin(2*math.pi*(10*(j+1))*t) + random.gauss(0, 1e-3) for j in range(len(self.names))]
+            block += struct.pack(fmt, 0., *vals)
+
+        return block
+
+    def start(self):
+        """
+        starts serving the simulated controller in a daemon thread
+
+            args:
+                nothing
+            returns:
+                nothing
+        """
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        stops the server thread and closes the listening socket
+
+            args:
+                nothing
+            returns:
+                nothing
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.sckt.close()
+        self.logger.info('Simulated Q.Gate stopped')
+
+    def serve(self):
+        """
+        accepts connections and answers controller commands until stop is called
+        a single client is served at a time, the same as the real controller
+
+            args:
+                nothing
+            returns:
+                nothing
+        """
+        while self.running:
+            try:
+                conn, addr = self.sckt.accept()
+            except socket.timeout:
+                continue
+
+            self.logger.info('Accepted connection from: '+ addr[0] + ' ' + str(addr[1]))
+
+            try:
+                self.handle(conn)
+            except (BrokenPipeError, ConnectionResetError):
+                self.logger.info('Client disconnected')
+            finally:
+                conn.close()
+
+    def handle(self, conn):
+        """
+        handles a single client connection, sending the greeting, the header and then streaming frames
+
+            args:
+                conn - (socket) : connected client socket
+            returns:
+                nothing
+        """
+        conn.settimeout(1)
+        conn.sendall(b'Q.Gate simulator ready\r\n')
+
+        while self.running:
+            try:
+                cmd = conn.recv(1024)
+            except socket.timeout:
+                continue
+
+            #the client closed the connection
+            if not cmd:
+                return
+
+            if cmd.startswith(b'$RBH'):
+                conn.sendall(self.make_header())
+                self.logger.info('Sent binary header')
+
+            elif cmd.startswith(b'$RBDC'):
+                self.logger.info('Streaming circular buffer')
+                self.stream(conn)
+                return
+
+    def stream(self, conn):
+        """
+        streams frames to the client at time_scale times the sampling frequency, until stopped or disconnected
+
+            args:
+                conn - (socket) : connected client socket
+            returns:
+                nothing
+        """
+
+        #10 ms (real time) of data is sent per block, counters are rewritten for every block
+        n = max(int(0.01*self.fs*self.time_scale), 1)
+        block = self.make_block(n)
+        frame_size = 8 + 4*len(self.names)
+
+        #counters continue from the start time in the header, as if the controller had been sampling since then
+        first = int((time.time() - self.t_start)*self.fs*self.time_scale)
+
+        #block while sending so a client that falls behind applies backpressure instead of timing out
+        #the stream only ends when the client disconnects
+        conn.settimeout(None)
+
+        self.frames_sent = 0
+        t0 = time.monotonic()
+
+        while self.running:
+            for i in range(n):
+                struct.pack_into('>d', block, i*frame_size, float(first + self.frames_sent + i))
+
+            #a block is only sent once its last frame has been sampled, sendall blocks while the client falls behind
+            wait = (self.frames_sent + n)/(self.fs*self.time_scale) - (time.monotonic() - t0)
+            if wait > 0:
+                time.sleep(wait)
+
+            conn.sendall(block)
+            self.frames_sent += n
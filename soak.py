@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#standard python repository
+import sys, getopt
+import os
+import configparser
+import logging
+import threading
+import queue
+import tempfile
+import tracemalloc
+import resource
+import time
+
+#my classes
+from daq import DAQ, daq_args
+from simulator import Simulator
+
+def rss_bytes():
+    """
+    returns the resident set size of the current process in bytes
+    reads /proc on Linux, otherwise falls back on the peak resident set size from getrusage
+
+        args:
+            nothing
+        returns:
+            rss - (int) : resident set size in bytes
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*resource.getpagesize()
+    except OSError:
+        #ru_maxrss is in bytes on OSX and in kilobytes elsewhere
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss*1024
+
+def fd_count():
+    """
+    returns the number of open file descriptors of the current process, or -1 if it cannot be determined
+
+        args:
+            nothing
+        returns:
+            n - (int) : number of open file descriptors
+    """
+    for path in ('/proc/self/fd', '/dev/fd'):
+        if os.path.isdir(path):
+            return len(os.listdir(path))
+    return -1
+
+class   Soak:
+    """
+    The Soak class drives the full DAQ against a local Simulator many times faster than real time,
+    sampling resource usage on a fixed simulated schedule and checking the growth against budgets
+    """
+
+    def __init__(self, days=1., time_scale=20., interval=3600., warmup=3600., fs=1000., scope_on=False, scope_rate=10., budgets=None, top=10, daq_args=None):
+        """
+        constructs the Soak class, starts the logger
+
+            args:
+                days - (number) : simulated duration of the soak test in days
+                time_scale - (number) : factor by which the simulated controller runs faster than real time
+                interval - (number) : simulated seconds between resource samples
+                warmup - (number) : simulated seconds before the baseline sample is taken, growth is measured from the baseline
+                fs - (number) : sampling frequency of the simulated controller in Hz
+                scope_on - (bool) : boolean flag to specify if the DAQ fills the scope queue during the test
+                scope_rate - (number) : number of queue items drained per real second, emulating a slow scope, 0 never drains
+                budgets - (None or dict) : allowed growth over the baseline, keys are 'rss_mb', 'traced_mb', 'threads', 'fds', 'queue' and 'writer'
+                top - (int) : number of top allocators (by growth since the baseline) to log at each sample
+                daq_args - (None or dict) : additional keyword arguments passed to the DAQ
+            returns:
+                nothing
+        """
+
+        self.logger = logging.getLogger('vib_daq.soak.Soak')
+
+        self.duration   = days*86400.
+        self.time_scale = time_scale
+        self.interval   = interval
+        self.warmup     = warmup
+        self.fs         = fs
+        self.scope_on   = scope_on
+        self.scope_rate = scope_rate
+        self.top        = top
+        self.daq_args   = daq_args or {}
+
+        #default budgets, a budget of None is not checked
+        self.budgets = {'rss_mb':50., 'traced_mb':20., 'threads':0, 'fds':0, 'queue':100, 'writer':100}
+        if budgets:
+            self.budgets.update(budgets)
+
+        #list of samples taken and budget violations found
+        self.samples    = []
+        self.violations = []
+        self.baseline   = None
+        self.snapshot   = None
+
+        self.logger.info('Created Soak successfully')
+
+    def sample(self, sim_time, q, daq, files):
+        """
+        takes one sample of the resource usage of the process
+
+            args:
+                sim_time - (number) : current simulated time in seconds
+                q - (Queue) : queue the DAQ writes the scope data to
+                daq - (DAQ) : DAQ instance being tested
+                files - (int) : number of data files written since the previous sample
+            returns:
+                s - (dict) : dictionary of the sampled values
+        """
+        s = {
+            'sim_time'  : sim_time,
+            'rss_mb'    : rss_bytes()/2**20,
+            'traced_mb' : tracemalloc.get_traced_memory()[0]/2**20,
+            'threads'   : threading.active_count(),
+            'fds'       : fd_count(),
+            'queue'     : q.qsize(),
+            'writer'    : daq.writer.depth(),
+            'files'     : files,
+            }
+
+        self.logger.info('Sample at '+ '{:.0f}'.format(sim_time) + ' s simulated: ' + ', '.join(k+'='+'{:.6g}'.format(v) for k,v in s.items() if k != 'sim_time'))
+        return s
+
+    def log_allocators(self):
+        """
+        logs the allocators with the largest growth since the baseline snapshot
+
+            args:
+                nothing
+            returns:
+                nothing
+        """
+        if self.snapshot is None or not self.top:
+            return
+
+        stats = tracemalloc.take_snapshot().compare_to(self.snapshot, 'lineno')
+        for stat in stats[:self.top]:
+            self.logger.info('Top allocator: '+ str(stat))
+
+    def check(self, s):
+        """
+        compares a sample against the baseline and the budgets
+
+            args:
+                s - (dict) : sample returned by the sample method
+            returns:
+                violations - (list) : list of strings describing each budget that was exceeded
+        """
+        violations = []
+        for key, budget in self.budgets.items():
+            if budget is None or s[key] < 0:
+                continue
+
+            #the queue depths are absolute, everything else is growth over the baseline
+            growth = s[key] if key in ('queue', 'writer') else s[key] - self.baseline[key]
+            if growth > budget:
+                violations.append(key + ' grew by ' + '{:.6g}'.format(growth) + ' (budget ' + str(budget) + ') after ' + '{:.0f}'.format(s['sim_time']) + ' s simulated')
+
+        return violations
+
+    def drain(self, q, daq):
+        """
+        drains the scope queue at scope_rate items per second, emulating a scope that is slower than the DAQ
+
+            args:
+                q - (Queue) : queue the DAQ writes the scope data to
+                daq - (DAQ) : DAQ instance being tested
+            returns:
+                nothing
+        """
+        while daq.take_data:
+            if self.scope_rate > 0 and not q.empty():
+                q.get()
+                time.sleep(1./self.scope_rate)
+            else:
+                time.sleep(0.1)
+
+    def run(self):
+        """
+        runs the soak test, the DAQ writes its files in a temporary directory that is cleared at every sample
+        the test stops at the first sample that exceeds a budget
+
+            args:
+                nothing
+            returns:
+                passed - (bool) : True if no budget was exceeded
+        """
+        tracemalloc.start()
+
+        sim = Simulator(fs=self.fs, time_scale=self.time_scale)
+        sim.start()
+
+        with tempfile.TemporaryDirectory(prefix='vib_soak_') as tmp:
+            q = queue.Queue()
+
+            #both the raw traces and the spectra go to the temporary directory
+            daq_args = dict(self.daq_args, vib_path=tmp, psd_path=tmp)
+
+            try:
+                daq = DAQ(sim.address, sim.port, q, scope_on=self.scope_on, time_scale=self.time_scale, **daq_args)
+
+                daq_thread = threading.Thread(target=daq.run)
+                scope_thread = threading.Thread(target=self.drain, args=(q, daq))
+                daq_thread.start()
+                if self.scope_on:
+                    scope_thread.start()
+
+                self.logger.info('Soak test started for '+ str(self.duration) + ' s simulated at ' + str(self.time_scale) + 'x real time')
+
+                next_sample = self.warmup
+                while not self.violations:
+                    sim_time = sim.frames_sent/self.fs
+
+                    if not daq_thread.is_alive():
+                        self.violations.append('DAQ thread stopped after ' + '{:.0f}'.format(sim_time) + ' s simulated')
+                        break
+
+                    if sim_time >= next_sample:
+                        #count and remove the files written since the last sample
+                        files = [f for f in os.listdir(tmp) if f.endswith('.csv')]
+                        for f in files:
+                            os.remove(os.path.join(tmp, f))
+
+                        s = self.sample(sim_time, q, daq, len(files))
+                        self.samples.append(s)
+
+                        if self.baseline is None:
+                            self.baseline = s
+                            self.snapshot = tracemalloc.take_snapshot()
+                        else:
+                            self.log_allocators()
+                            self.violations += self.check(s)
+
+                        next_sample += self.interval
+
+                    if sim_time >= self.duration:
+                        break
+
+                    time.sleep(0.05)
+
+                daq.take_data = False
+                daq_thread.join()
+                if self.scope_on:
+                    scope_thread.join()
+
+            finally:
+                sim.stop()
+                tracemalloc.stop()
+
+        for v in self.violations:
+            self.logger.error('Soak budget exceeded: '+ v)
+
+        if not self.violations:
+            self.logger.info('Soak test passed after '+ str(len(self.samples)) + ' samples')
+
+        return not self.violations
+
+def usage():
+    print('Usage: soak.py --additional-arguments')
+    print()
+    print('Note that both long and short format arguments followed by "=" require an additional argument')
+    print('Example: soak.py --days=7 --scale=50')
+    print()
+    print('Options:')
+    print('-h, --help         : display usage')
+    print('-d, --days=        : simulated duration of the test in days')
+    print('-x, --scale=       : factor by which the simulation runs faster than real time')
+    print('-s, --scope        : fill the scope queue during the test')
+
+def main():
+    """
+    Soak test executable for the vibration DAQ used for CUTE
+    It reads the [soak] section of the configuration file, and the DAQ parameters from the same sections as main.py so the DAQ is tested as configured,
+    runs the Soak test and exits with a non zero status if a budget was exceeded
+    """
+
+    daq_path = sys.path[0]
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hsd:x:', ['help','scope','days=','scale='])
+
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    #set up the logger, the DAQ classes log to children of this logger
+    logger = logging.getLogger('vib_daq')
+    logger.setLevel(logging.DEBUG)
+
+    fh = logging.FileHandler(os.path.join(daq_path,'vib_daq_soak.log'))
+    fh.setLevel(logging.INFO)
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.ERROR)
+
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    fh.setFormatter(formatter)
+    ch.setFormatter(formatter)
+    logger.addHandler(fh)
+    logger.addHandler(ch)
+
+    #read the soak parameters from the config file
+    config = configparser.ConfigParser()
+    config.optionxform = str    #preserve case on import
+    config.read(os.path.join(daq_path,'vib_daq.cfg'))
+    cfg = config['soak'] if 'soak' in config.sections() else {}
+
+    def getfloat(key, default):
+        return float(cfg[key]) if key in cfg else default
+
+    def getbool(key, default):
+        return cfg[key].lower() in ('1','yes','true','on') if key in cfg else default
+
+    #the DAQ is set up as in main.py, the controller address and output directories are replaced by the test
+    kwargs_daq = daq_args(config)
+    kwargs_daq['save_raw'] = getbool('SaveRaw', False)
+
+    kwargs = {
+        'days'       : getfloat('Days', 1.),
+        'time_scale' : getfloat('TimeScale', 20.),
+        'interval'   : getfloat('Interval', 3600.),
+        'warmup'     : getfloat('Warmup', 3600.),
+        'fs'         : getfloat('SampleRate', 1000.),
+        'scope_on'   : getbool('ScopeOn', False),
+        'scope_rate' : getfloat('ScopeRate', 10.),
+        'top'        : int(getfloat('TopAllocators', 10)),
+        'budgets'    : {
+            'rss_mb'    : getfloat('RSSBudgetMB', 50.),
+            'traced_mb' : getfloat('TracedBudgetMB', 20.),
+            'threads'   : getfloat('ThreadBudget', 0),
+            'fds'       : getfloat('FDBudget', 0),
+            'queue'     : getfloat('QueueBudget', 100),
+            'writer'    : getfloat('WriterBudget', 100),
+            },
+        'daq_args'   : kwargs_daq,
+        }
+
+    for opt, arg in opts:
+        if opt in ('-h','--help'):
+            usage()
+            sys.exit(0)
+        elif opt in ('-d','--days'):
+            kwargs['days'] = float(arg)
+        elif opt in ('-x','--scale'):
+            kwargs['time_scale'] = float(arg)
+        elif opt in ('-s','--scope'):
+            kwargs['scope_on'] = True
+
+    soak = Soak(**kwargs)
+    passed = soak.run()
+
+    print('PASSED' if passed else 'FAILED')
+    for v in soak.violations:
+        print('  ' + v)
+
+    sys.exit(0 if passed else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#standard python repository
+import logging
+
+#SciPy stack
+import numpy as np
+import scipy.fft
+from scipy.signal import get_window, detrend as sig_detrend
+
+class   Spectrum:
+    """
+    The Spectrum class estimates power spectral densities using Welch's method, batched over all channels at once
+    Windows and their sums are cached per (n_fft, segment, window, dtype) and shared by every instance,
+    so they are built once and reused across averages and channels
+    """
+
+    #cache of window "plans", maps (n_fft, nperseg, window, dtype) to (window array, sum of its squares, square of its sum)
+    #the sampling frequency is applied when a plan is used, so instances with different rates can share them
+    plans = {}
+
+    def __init__(self, fs, n_fft, window='hann', nperseg=256, overlap=0.5, detrend='constant', scaling='density', float32=False, workers=-1, workers_min=2**16):
+        """
+        constructs the Spectrum class, starts the logger
+
+            args:
+                fs - (number) : sampling frequency in Hz
+                n_fft - (int) : length of the FFT, segments shorter than this are zero padded
+                window - (string or tuple) : window specification accepted by scipy.signal.get_window, eg. 'hann' or ('tukey', 0.25)
+                nperseg - (int) : number of samples in each segment, capped to the length of the data
+                overlap - (float) : fraction of a segment that overlaps with the next, between 0 and 1
+                detrend - (string or False) : 'constant', 'linear' or False, detrending applied to each segment
+                scaling - (string) : 'density' for V**2/Hz or 'spectrum' for V**2
+                float32 - (bool) : boolean flag to do the calculation in single precision, halving the memory and FFT time
+                workers - (int) : number of FFT workers for long FFTs, negative values count back from the number of CPUs
+                workers_min - (int) : n_fft from which multiple FFT workers are used, shorter FFTs use a single worker
+            returns:
+                nothing
+        """
+
+        self.logger = logging.getLogger('vib_daq.spectrum.Spectrum')
+
+        if scaling not in ('density', 'spectrum'):
+            self.logger.error('Unknown PSD scaling: ' + str(scaling))
+            raise ValueError('scaling must be "density" or "spectrum"')
+
+        if detrend not in ('constant', 'linear', False):
+            self.logger.error('Unknown PSD detrend: ' + str(detrend))
+            raise ValueError('detrend must be "constant", "linear" or False')
+
+        if not 0 <= overlap < 1:
+            self.logger.error('Invalid PSD overlap: ' + str(overlap))
+            raise ValueError('overlap must be in the interval [0, 1)')
+
+        self.fs      = fs
+        self.n_fft   = int(n_fft)
+        self.window  = window
+        self.nperseg = int(nperseg)
+        self.overlap = overlap
+        self.detrend = detrend
+        self.scaling = scaling
+        self.dtype   = np.float32 if float32 else np.float64
+        self.workers = workers if self.n_fft >= workers_min else 1
+
+        #frequencies of the one sided spectrum
+        self.freq = scipy.fft.rfftfreq(self.n_fft, 1/self.fs).astype(self.dtype)
+
+        self.logger.info('Created Spectrum successfully')
+
+    def plan(self, nperseg):
+        """
+        returns the cached window and its sums for a segment length, building them on first use
+
+            args:
+                nperseg - (int) : number of samples in each segment
+            returns:
+                plan - (tuple) : window array, sum of its squares, square of its sum
+        """
+        key = (self.n_fft, nperseg, self.window, self.dtype)
+
+        if key not in self.plans:
+            win = get_window(self.window, nperseg).astype(self.dtype)
+            self.plans[key] = (win, np.sum(win**2), np.sum(win)**2)
+            self.logger.info('Built PSD plan for n_fft '+ str(self.n_fft) + ', segment ' + str(nperseg) + ', window ' + str(self.window))
+
+        return self.plans[key]
+
+    def segments(self, x):
+        """
+        splits the data into overlapping segments, detrends and windows them and takes their FFT
+
+            args:
+                x - (array) : 2D array of shape (channels, samples), or 1D for a single channel
+            returns:
+                X - (array) : complex array of shape (channels, segments, n_fft//2+1)
+                scale - (float) : scale factor converting |X|**2 into the requested scaling
+        """
+        x = np.atleast_2d(np.asarray(x, dtype=self.dtype))
+
+        #segments can't be longer than the data or the FFT
+        nperseg = min(self.nperseg, x.shape[-1], self.n_fft)
+        step = max(nperseg - int(nperseg*self.overlap), 1)
+        win, sum_sq, sq_sum = self.plan(nperseg)
+
+        #view of the segments without copying, detrending and windowing make the only copy
+        segs = np.lib.stride_tricks.sliding_window_view(x, nperseg, axis=-1)[:, ::step, :]
+
+        if self.detrend == 'constant':
+            segs = segs - segs.mean(axis=-1, keepdims=True)
+        elif self.detrend == 'linear':
+            segs = sig_detrend(segs, type='linear', axis=-1)
+
+        X = scipy.fft.rfft(segs*win, n=self.n_fft, axis=-1, workers=self.workers)
+
+        return X, 1/(self.fs*sum_sq) if self.scaling == 'density' else 1/sq_sum
+
+    def onesided(self, P):
+        """
+        folds the negative frequencies into a one sided spectrum, in place
+
+            args:
+                P - (array) : spectrum whose last axis is the rfft frequency axis
+            returns:
+                P - (array) : the same array, doubled everywhere except at DC and (for even n_fft) Nyquist
+        """
+        if self.n_fft % 2:
+            P[..., 1:] *= 2
+        else:
+            P[..., 1:-1] *= 2
+        return P
+
+    def psd(self, x):
+        """
+        calculates the power spectral density of each channel, averaged over the segments
+
+            args:
+                x - (array) : 2D array of shape (channels, samples), or 1D for a single channel
+            returns:
+                freq - (array) : frequencies of the spectrum in Hz
+                Pxx - (array) : array of shape (channels, n_fft//2+1) with the PSD of each channel
+        """
+        X, scale = self.segments(x)
+
+        Pxx = (X.real**2 + X.imag**2).mean(axis=-2)*scale
+
+        return self.freq, self.onesided(Pxx)
+
+    def csd(self, x):
+        """
+        calculates the cross spectral density matrix of all channel pairs from the same windowed segments as psd,
+        the diagonal holds the auto spectra, equal to the result of psd
+
+            args:
+                x - (array) : 2D array of shape (channels, samples)
+            returns:
+                freq - (array) : frequencies of the spectrum in Hz
+                Sxy - (array) : complex array of shape (channels, channels, n_fft//2+1), Sxy[i,j] is the cross spectrum conj(X_i)*X_j
+        """
+        X, scale = self.segments(x)
+
+        #batched over every pair and averaged over the segments in one pass
+        Sxy = np.einsum('isf,jsf->ijf', X.conj(), X)*(scale/X.shape[-2])
+
+        return self.freq, self.onesided(Sxy)
+
+    def coherence(self, Sxy):
+        """
+        calculates the magnitude squared coherence of every channel pair from a cross spectral density matrix
+
+            args:
+                Sxy - (array) : cross spectral density matrix as returned by csd, averaged if needed
+            returns:
+                Cxy - (array) : array of shape (channels, channels, n_fft//2+1), nan where a channel has no power
+        """
+        P = Sxy.diagonal(axis1=0, axis2=1).real.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (Sxy.real**2 + Sxy.imag**2)/(P[:,None,:]*P[None,:,:])
+
+    def transfer(self, Sxy):
+        """
+        calculates the H1 transfer function estimate of every channel pair from a cross spectral density matrix
+
+            args:
+                Sxy - (array) : cross spectral density matrix as returned by csd, averaged if needed
+            returns:
+                Hxy - (array) : complex array of shape (channels, channels, n_fft//2+1), Hxy[i,j] is the transfer function from input i to output j
+        """
+        P = Sxy.diagonal(axis1=0, axis2=1).real.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return Sxy/P[:,None,:]
@@ -2,6 +2,9 @@
 import struct
 import logging
 
+#SciPy stack
+import numpy as np
+
 class   UDBF:
     """
     The UDBF class decodes the version 1.07 of the Universal Data Bin File format, as specified by Gantner Instruments.
@@ -109,6 +112,9 @@ class   UDBF:
 
             VarStart = VarStart + nl + ul + 14
 
+        #absolute start time as a unix timestamp, StartTime counts days from the OLE epoch of 1899-12-30
+        self.t0 = (self.StartTime*self.StartTime2DayF - 25569.)*86400.
+
         #make the list of names including the counter
         self.var_names = ['Counter'] + self.Name
         self.var_sizes = [8] + [4 for i in range(self.VarCount)]
@@ -144,3 +150,14 @@ class   UDBF:
 
         return data
 
+
+    def timestamps(self, counter):
+        """
+        converts the Counter values of decoded frames to absolute time, using the StartTime and dActTime2SecF from the header
+
+            args:
+                counter - (list or array) : Counter values of the frames, as returned by decode_buffer
+            returns:
+                t - (array) : absolute time of each frame as a unix timestamp in seconds
+        """
+        return self.t0 + np.asarray(counter, dtype=np.float64)*self.dActTime2SecF
@@ -0,0 +1,316 @@
+#standard python repository
+import os
+import csv
+import logging
+import threading
+import queue
+import time
+import re
+
+#my classes
+from recording import stamp, last_newline
+
+#matches the temporary files the writer produces, eg. vib_fs1000_181019_140310_123456.csv.part
+TEMP_RE = re.compile(r'^(vib|psd|coh|tf)_fs\d+_\d{6}_\d{6}_\d{6}\.csv\.(tmp|part)$')
+
+class   Writer:
+    """
+    The Writer class writes the DAQ output files from a background thread, so slow disks don't stall the acquisition
+    Jobs are queued by the DAQ and written in batches, files are written under a temporary name and atomically renamed when complete,
+    and raw trace streams are rotated into new files by size and age
+    Complete files are written as <name>.tmp and streams as <name>.part, only the rows of a stream can be salvaged after a crash
+    """
+
+    def __init__(self, max_bytes=50*2**20, max_age=3600., fsync='rotate', batch=64, max_queue=1000):
+        """
+        constructs the Writer class, starts the logger
+
+            args:
+                max_bytes - (int) : size in bytes after which a stream is rotated into a new file
+                max_age - (number) : time in seconds after which a stream is rotated into a new file
+                fsync - (string) : when files are synced to disk, 'batch' after every batch, 'rotate' only when a file is completed, or 'never'
+                batch - (int) : maximum number of jobs written before the files are flushed
+                max_queue - (int) : number of queued jobs from which raw appends are dropped with an error, so a stalled disk can't grow the memory without bound,
+                    complete files like the PSDs are always queued, 0 never drops
+            returns:
+                nothing
+        """
+
+        self.logger = logging.getLogger('vib_daq.writer.Writer')
+
+        if fsync not in ('batch', 'rotate', 'never'):
+            self.logger.error('Unknown fsync policy: ' + str(fsync))
+            raise ValueError('fsync must be "batch", "rotate" or "never"')
+
+        self.max_bytes = max_bytes
+        self.max_age   = max_age
+        self.fsync     = fsync
+        self.batch     = batch
+        self.max_queue = max_queue
+
+        #queue of jobs for the writer thread, and the streams it has open, keyed by (directory, prefix)
+        self.queue   = queue.Queue()
+        self.streams = {}
+        self.thread  = None
+
+        #number of raw appends dropped because the queue was full
+        self.dropped = 0
+
+        self.logger.info('Created Writer successfully')
+
+    def depth(self):
+        """
+        returns the number of jobs waiting to be written
+
+            args:
+                nothing
+            returns:
+                n - (int) : number of queued jobs
+        """
+        return self.queue.qsize()
+
+    def recover(self, path):
+        """
+        cleans up the temporary files left in a directory by a previous run that did not exit cleanly
+        only names the writer produces are touched, any other file in the directory is left alone
+        stream files are completed, cutting off a partially written last row, unless they don't even hold a complete header line
+        any other temporary file was a complete file that was never finished, and is deleted
+
+            args:
+                path - (string) : directory to recover
+            returns:
+                nothing
+        """
+        for f in os.listdir(path):
+            m = TEMP_RE.match(f)
+            if not m:
+                continue
+
+            tmp = os.path.join(path, f)
+
+            if m.group(2) == 'tmp':
+                os.remove(tmp)
+                self.logger.info('Removed unfinished file: '+ f)
+                continue
+
+            with open(tmp, 'rb+') as fh:
+                end = last_newline(fh)
+                fh.truncate(end)
+
+            #without the header line there is nothing to recover
+            if not end:
+                os.remove(tmp)
+                self.logger.info('Removed empty stream file: '+ f)
+                continue
+
+            self.commit(tmp, path)
+            self.logger.info('Recovered stream file: '+ f[:-5])
+
+    def start(self, paths=()):
+        """
+        recovers any leftover temporary files and starts the writer thread
+
+            args:
+                paths - (iterable) : directories to recover before starting, only give directories dedicated to the DAQ output
+            returns:
+                nothing
+        """
+        for path in paths:
+            self.recover(path)
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+
+    def close(self):
+        """
+        writes all queued jobs, completes the open streams and stops the writer thread
+
+            args:
+                nothing
+            returns:
+                nothing
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def append(self, path, prefix, headers, columns):
+        """
+        queues rows to be appended to a rotating stream of files, eg. the raw traces
+        files of the stream are named by the prefix and the time in the first column of their first row
+        the rows are dropped, and an error logged, if max_queue jobs are already waiting
+
+            args:
+                path - (string) : directory of the stream
+                prefix - (string) : start of the file names, eg. 'vib_fs1000'
+                headers - (list) : names of the columns
+                columns - (list) : list of lists of values, one per column, the first column holds the unix time
+            returns:
+                nothing
+        """
+        if self.max_queue and self.depth() >= self.max_queue:
+            self.dropped += 1
+            self.logger.error('Writer queue full, dropped '+ str(len(columns[0])) + ' rows of ' + prefix + ', ' + str(self.dropped) + ' appends dropped so far')
+            return
+
+        self.queue.put(('append', path, prefix, headers, columns))
+
+    def write(self, path, name, headers, columns):
+        """
+        queues a complete file to be written, eg. a PSD
+
+            args:
+                path - (string) : directory of the file
+                name - (string) : name of the file
+                headers - (list) : names of the columns
+                columns - (list) : list of lists of values, one per column
+            returns:
+                nothing
+        """
+        self.queue.put(('write', path, name, headers, columns))
+
+    def sync(self, fh):
+        """
+        flushes a file and syncs it to disk
+
+            args:
+                fh - (file) : open file
+            returns:
+                nothing
+        """
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    def commit(self, tmp, path):
+        """
+        atomically renames a completed temporary file to its final name
+
+            args:
+                tmp - (string) : path of the temporary file
+                path - (string) : directory of the file
+            returns:
+                nothing
+        """
+        os.replace(tmp, os.path.splitext(tmp)[0])
+
+        #sync the directory so the rename itself survives a crash, not supported on all systems
+        if self.fsync != 'never':
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+
+    def rotate(self, key):
+        """
+        completes the open file of a stream
+
+            args:
+                key - (tuple) : (directory, prefix) of the stream
+            returns:
+                nothing
+        """
+        stream = self.streams.pop(key)
+        if self.fsync != 'never':
+            self.sync(stream['fh'])
+        stream['fh'].close()
+        self.commit(stream['tmp'], key[0])
+
+        self.logger.info('Completed file: '+ os.path.basename(os.path.splitext(stream['tmp'])[0]))
+
+    def handle(self, job):
+        """
+        writes a single job
+
+            args:
+                job - (tuple) : job as queued by append or write
+            returns:
+                nothing
+        """
+        kind, path, name, headers, columns = job
+
+        if kind == 'write':
+            tmp = os.path.join(path, name + '.tmp')
+            with open(tmp, 'w', newline='') as fh:
+                writer = csv.writer(fh)
+                writer.writerow(headers)
+                writer.writerows(zip(*columns))
+                if self.fsync != 'never':
+                    self.sync(fh)
+            self.commit(tmp, path)
+            self.logger.info('Wrote file: '+ name)
+            return
+
+        #rotate the stream if its headers changed, or it is too large or too old
+        key = (path, name)
+        stream = self.streams.get(key)
+        if stream is not None:
+            if stream['headers'] != headers or stream['fh'].tell() >= self.max_bytes or time.monotonic() - stream['opened'] >= self.max_age:
+                self.rotate(key)
+                stream = None
+
+        if stream is None:
+            tmp = os.path.join(path, name + '_' + stamp(columns[0][0]) + '.csv.part')
+            fh = open(tmp, 'w', newline='')
+            stream = {'fh':fh, 'tmp':tmp, 'writer':csv.writer(fh), 'headers':headers, 'opened':time.monotonic()}
+            stream['writer'].writerow(headers)
+            self.streams[key] = stream
+
+        stream['writer'].writerows(zip(*columns))
+
+    def run(self):
+        """
+        main loop of the writer thread, takes up to batch jobs at a time, writes them and flushes the open streams
+        stops once close is called and the queue is empty
+
+            args:
+                nothing
+            returns:
+                nothing
+        """
+        stop = False
+        while not stop:
+
+            #wake up regularly so idle streams still rotate by age
+            try:
+                jobs = [self.queue.get(timeout=1.)]
+            except queue.Empty:
+                jobs = []
+
+            try:
+                while len(jobs) < self.batch:
+                    jobs.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            for job in jobs:
+                if job is None:
+                    stop = True
+                    continue
+                #any failure is logged and the job dropped, so the thread keeps serving the DAQ
+                try:
+                    self.handle(job)
+                except Exception:
+                    self.logger.exception('Could not write job: '+ job[2])
+
+            #flush the batch, rotate old streams, and complete everything when stopping
+            for key in list(self.streams):
+                stream = self.streams[key]
+                try:
+                    if stop or time.monotonic() - stream['opened'] >= self.max_age:
+                        self.rotate(key)
+                    elif self.fsync == 'batch':
+                        self.sync(stream['fh'])
+                    else:
+                        stream['fh'].flush()
+                except Exception:
+                    self.logger.exception('Could not flush stream: '+ key[1])
+
+            if jobs:
+                self.logger.debug('Wrote batch of '+ str(len(jobs)) + ' jobs, ' + str(self.depth()) + ' still queued')
+
+        self.logger.info('Writer finished')